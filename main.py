@@ -76,11 +76,42 @@
  *       XYZ tile generation.                                              *
  *     - The `-zip` flag is an optional flag; when used, it enables        *
  *       archiving of the output directory into a zip file for easy        *
- *       distribution and storage.                                         *
+ *       distribution and storage. The zip file is written next to the     *
+ *       output directory, e.g. "E:/XYZ_Tiles/output.zip".                 *
  *     - The `-mark` flag is for specifying the watermark text to be       *
  *       applied to the tiles. This flag is optional.                      *
  *     - The `-plog` flag is for creating a txt file which contains XYZ    *
  *       tile paths. This flag is optional.                                *
+ *     - The `-fmt` flag is for specifying the tile format, `png` or `jpg` *
+ *       (default). This flag is optional.                                 *
+ *     - The `-q` flag is for specifying the JPG quality (default 95).     *
+ *       This flag is optional.                                            *
+ *     - The `-meta` flag is for specifying the metatile size, the number  *
+ *       of tiles per side QGIS renders at once (default 8). Larger values *
+ *       need fewer render passes but more memory. This flag is optional.  *
+ *     - The `-dpi` flag is for specifying the DPI of the rendered tiles   *
+ *       (default 96). This flag is optional.                              *
+ *     - The `-j` flag is for specifying how many processes generate tiles *
+ *       in parallel, one zoom level each (default: number of usable       *
+ *       CPUs). Every process renders with QGIS's default number of        *
+ *       threads, so the largest zoom level still uses all CPUs once the   *
+ *       smaller ones are done. This flag is optional.                     *
+ *     - The `-jw` flag is for specifying how many threads watermark tiles *
+ *       at once (default: number of usable CPUs, at most 4). This flag is *
+ *       optional.                                                         *
+ *     - The `-jwp` flag runs the `-jw` watermark workers as processes     *
+ *       instead of threads, for CPU-bound (e.g. PNG) watermarking. `-jw`  *
+ *       then defaults to the number of usable CPUs. This flag is          *
+ *       optional.                                                         *
+ *     - The `-zipc` flag is for choosing how the zip compresses files     *
+ *       other than tiles: stored, deflated (default), bzip2 or lzma.      *
+ *       Tiles are always stored. This flag is optional.                   *
+ *     - The `-afmt` flag is for choosing the archive format: zip         *
+ *       (default) or tar.zst, which needs the zstandard package. This     *
+ *       flag is optional.                                                 *
+ *     - The `--force-retile` flag regenerates the tiles even if the output *
+ *       directory already holds them for the same raster, zoom range and  *
+ *       tile settings. This flag is optional.                             *
  *                                                                         *
  *     For example, to generate tiles with a minimum zoom of 7 and a       *
  *     maximum zoom of 17, apply a watermark "2024", and zip the output    *
@@ -101,15 +132,191 @@
 # main.py
 
 import argparse
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import os
+import pathlib
+import queue
+import threading
+import time
 
-from xyz_tiler import xyz_tiler
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+from xyz_tiler import xyz_tiler, XyzTilerSession, default_worker_count, init_tiler_worker, tile_zoom_level, raster_extent_wgs84, tile_count, write_preview_html
 from xyz_tile_cleaner import xyz_tile_cleaner
-from xyz_tile_watermarker import xyz_tile_watermarker
-from xyz_tile_archiver import xyz_tile_archiver
+from xyz_tile_watermarker import xyz_tile_watermarker, clear_watermark_sentinel, render_watermark_overlay, pillow_build, PILLOW_SIMD
+from xyz_tile_archiver import xyz_tile_archiver_stream, zstandard
 from xyz_tile_pathsaver import xyz_tile_pathsaver
+from xyz_tile_scanner import xyz_tile_scan
+
+# Describes the tiles in the output directory, see tiling_manifest().
+MANIFEST_NAME = '.forge_manifest.json'
+# Bytes hashed from the start and from the end of a raster, see raster_fingerprint().
+FINGERPRINT_CHUNK_SIZE = 16 * 1024 * 1024
+# Watermarked tiles (and zoom levels) waiting for the archiver. When it falls behind, the
+# watermarker waits, and with it its workers, which only run a few tiles ahead (see bounded_map()).
+ZIP_QUEUE_SIZE = 256
+
+def raster_fingerprint(raster_path):
+    """Hash the first and last 16 MiB of a raster file together with its size.
+
+    Unlike the modification time this changes when a raster is replaced by a copy that keeps
+    its time stamp, while reading at most 32 MiB of a multi-GiB raster. BLAKE3 is used when the
+    blake3 package is installed, BLAKE2b otherwise; the name is part of the result.
+    """
+    hasher = blake3.blake3() if blake3 else hashlib.blake2b()
+    size = os.path.getsize(raster_path)
+    with open(raster_path, 'rb') as raster_file:
+        hasher.update(raster_file.read(FINGERPRINT_CHUNK_SIZE))
+        if size > FINGERPRINT_CHUNK_SIZE:
+            raster_file.seek(max(FINGERPRINT_CHUNK_SIZE, size - FINGERPRINT_CHUNK_SIZE))
+            hasher.update(raster_file.read(FINGERPRINT_CHUNK_SIZE))
+    hasher.update(size.to_bytes(8, 'little'))
+    return ('blake3:' if blake3 else 'blake2b:') + hasher.hexdigest()
+
+def tiling_manifest(tiler_config):
+    """Describe a tiling run by the raster file it reads and the settings that shape its tiles.
+
+    Returns None for rasters that are not plain files (e.g. GDAL virtual paths), which are always tiled.
+    """
+    raster_path = tiler_config['xyz_raster_path']
+    if not os.path.isfile(raster_path):
+        return None
+    return {
+        "raster_path": os.path.abspath(raster_path),
+        "raster_hash": raster_fingerprint(raster_path),
+        "zoom_min": tiler_config['xyz_zoom_min'],
+        "zoom_max": tiler_config['xyz_zoom_max'],
+        "tile_format": tiler_config['xyz_tile_format'],
+        "quality": tiler_config['xyz_quality'],
+        "dpi": tiler_config['xyz_dpi']
+    }
+
+def read_manifest(manifest_path):
+    """Return the manifest stored at manifest_path, or None if there is no readable one."""
+    try:
+        with open(manifest_path, encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(manifest_path, manifest):
+    with open(manifest_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+def zoom_levels_on_disk(output_path):
+    """Return the zoom levels that already have a tile directory in output_path, in ascending order."""
+    return sorted(int(entry.name) for entry in os.scandir(output_path)
+                  if entry.is_dir() and entry.name.isdigit())
+
+def run_tiler(tiler_config, done_queue):
+    """Tile each zoom level of the configured range in its own worker process.
+
+    Every zoom level is put on done_queue as soon as its tiles are written. With a single
+    worker, the zoom levels are tiled in this process with one QGIS application instead.
+    """
+    output_path = tiler_config['xyz_output_path']
+    if tiler_config['xyz_zoom_min'] is None or tiler_config['xyz_zoom_max'] is None:
+        xyz_tiler(tiler_config)
+        for zoom_level in zoom_levels_on_disk(output_path):
+            clear_watermark_sentinel(os.path.join(output_path, str(zoom_level)))
+            done_queue.put(zoom_level)
+        return
+
+    zoom_min = tiler_config['xyz_zoom_min']
+    zoom_max = tiler_config['xyz_zoom_max']
+    # Zoom levels are independent, so each one becomes a separate tiling job.
+    zoom_configs = [dict(tiler_config, xyz_zoom_min=z, xyz_zoom_max=z) for z in range(zoom_min, zoom_max + 1)]
+    # The raster extent is read once here instead of in every worker. Each zoom level has about
+    # four times the tiles of the one above it, so the largest jobs are started first to keep
+    # the workers busy until the end.
+    extent = raster_extent_wgs84(tiler_config['xyz_raster_path'])
+    if extent:
+        for zoom_config in zoom_configs:
+            zoom_config['xyz_extent'] = extent
+        zoom_configs.sort(key=lambda zoom_config: tile_count(extent, zoom_config['xyz_zoom_min']), reverse=True)
+        print(f"{sum(tile_count(extent, z) for z in range(zoom_min, zoom_max + 1))} tiles to generate.")
+    # The leaflet preview would be written by every job at once. It is written once for the whole
+    # zoom range instead; without the extent, only the quickest job (the smallest zoom level) writes it.
+    preview_config = None
+    if extent:
+        write_preview_html(tiler_config, extent)
+    else:
+        preview_config = min(zoom_configs, key=lambda zoom_config: zoom_config['xyz_zoom_min'])
+    for zoom_config in zoom_configs:
+        if zoom_config is not preview_config:
+            zoom_config['xyz_output_html'] = ''
+    # Regenerated tiles carry no watermark yet.
+    for zoom_level in range(zoom_min, zoom_max + 1):
+        clear_watermark_sentinel(os.path.join(output_path, str(zoom_level)))
+    max_workers = min(tiler_config['xyz_processes'], len(zoom_configs))
+    if max_workers == 1:
+        # QGIS is started exactly once for the whole run; the other stages don't need it.
+        with XyzTilerSession(tiler_config['qgis_main_path']) as session:
+            # Smallest zoom levels first, so the next stages can start on them early.
+            for zoom_config in sorted(zoom_configs, key=lambda zoom_config: zoom_config['xyz_zoom_min']):
+                session.tile(zoom_config)
+                print(f"Zoom level {zoom_config['xyz_zoom_min']} tiles are generated.")
+                done_queue.put(zoom_config['xyz_zoom_min'])
+        return
+
+    print(f"Tiling zoom levels {zoom_min}-{zoom_max} with {max_workers} worker processes...")
+    # Every worker starts its own QGIS application once; QGIS objects are never shared across processes.
+    # Workers keep QGIS's default render thread count: the largest zoom level holds most of the tiles,
+    # and once the small levels are done its worker is the only one left to use the CPUs.
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_tiler_worker,
+                             initargs=(tiler_config['qgis_main_path'],)) as executor:
+        futures = [executor.submit(tile_zoom_level, zoom_config) for zoom_config in zoom_configs]
+        for future in as_completed(futures):
+            zoom_level = future.result()
+            print(f"Zoom level {zoom_level} tiles are generated.")
+            done_queue.put(zoom_level)
+
+def run_stage(stage, in_queue, out_queue, errors):
+    """Apply stage to each zoom level taken from in_queue until None arrives, passing it on to out_queue.
+
+    A failing zoom level is recorded in errors and not passed on, the remaining ones still are.
+    """
+    while True:
+        zoom_level = in_queue.get()
+        if zoom_level is None:
+            break
+        try:
+            stage(zoom_level)
+        except Exception as error:
+            errors.append(error)
+            continue
+        out_queue.put(zoom_level)
+
+def start_thread(errors, target, *args):
+    """Run target(*args) in a new thread, recording an exception it raises in errors."""
+    def run():
+        try:
+            target(*args)
+        except Exception as error:
+            errors.append(error)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def run_archiver(config, zoom_queue):
+    """Run the stream archiver. If it fails, the queue is still emptied until None arrives, so
+    the stages feeding the bounded queue are not blocked forever."""
+    try:
+        xyz_tile_archiver_stream(config, zoom_queue)
+    except Exception:
+        while zoom_queue.get() is not None:
+            pass
+        raise
+
+def start_stage(stage, in_queue, out_queue, errors):
+    return start_thread(errors, run_stage, stage, in_queue, out_queue, errors)
 
 def main():
     
@@ -117,17 +324,61 @@ def main():
     parser = argparse.ArgumentParser(description='XYZ Tile Forge: Automates the process of generating, cleaning, and watermarking XYZ tiles.')
     parser.add_argument('-i', '--input', required=False, help='Path to the input raster file.')
     parser.add_argument('-o', '--output', required=True, help='Path to the output directory for XYZ tiles.')
-    parser.add_argument('-min', '--minlayer', required=False, help= 'Minimum zoom layer for XYZ tiles.')
-    parser.add_argument('-max', '--maxlayer', required=False, help='Maximum zoom layer for XYZ tiles.')
-    parser.add_argument('-clear', '--clear', required=False, help='Remove tiles below threshold.')
+    parser.add_argument('-min', '--minlayer', type=int, required=False, help= 'Minimum zoom layer for XYZ tiles.')
+    parser.add_argument('-max', '--maxlayer', type=int, required=False, help='Maximum zoom layer for XYZ tiles.')
+    parser.add_argument('-clear', '--clear', type=int, required=False, help='Remove tiles below threshold.')
     parser.add_argument('-mark', '--watermark', required=False, help='Watermark text to be applied')
     parser.add_argument('-zip', '--zip', action='store_true', help='Enable archiving of the output directory into a zip file.')  # Sıkıştırma opsiyonu eklendi
+    parser.add_argument('-zipc', '--zip-compression', choices=['stored', 'deflated', 'bzip2', 'lzma'], default='deflated', help='Compression of files other than tiles in the zip (default: deflated). Tiles are always stored.')
+    parser.add_argument('-afmt', '--archive-format', choices=['zip', 'tar.zst'], default='zip', help='Format of the archive (default: zip). tar.zst needs the zstandard package.')
     parser.add_argument('-plog', '--pathlog', action='store_true', help='Enable creating a pathway list of xyz tiles.')
+    parser.add_argument('-fmt', '--format', choices=['png', 'jpg'], default='jpg', help='Tile image format. JPG encodes several times faster than PNG.')
+    parser.add_argument('-q', '--quality', type=int, default=95, help='JPG quality of generated and watermarked tiles.')
+    parser.add_argument('-meta', '--metatilesize', type=int, default=8, help='Tiles rendered per side in one QGIS render pass (default 8). Larger values render fewer, bigger images: each needs (meta*256)^2*4 bytes of RAM per worker, 16 MiB at 8.')
+    parser.add_argument('-dpi', '--dpi', type=int, default=96, help='DPI of the rendered tiles (default 96).')
+    parser.add_argument('-j', '--processes', type=int, default=default_worker_count(), help='Number of processes generating tiles in parallel, one zoom level each (default: number of usable CPUs). Each process renders with QGIS\'s default number of threads.')
+    parser.add_argument('-jw', '--watermark-workers', type=int, help='Number of threads watermarking tiles at once (default: number of usable CPUs, at most 4; with -jwp all usable CPUs).')
+    parser.add_argument('-jwp', '--watermark-processes', action='store_true', help='Watermark tiles in worker processes instead of threads.')
+    parser.add_argument('--force-retile', action='store_true', help='Generate the tiles even if the output already holds them for the same raster and settings.')
 
     # Parsing the arguments
     args = parser.parse_args()
+    if args.processes < 1:
+        parser.error("-j/--processes must be at least 1")
+    if args.minlayer is not None and args.maxlayer is not None and args.minlayer > args.maxlayer:
+        parser.error("-min/--minlayer must not be greater than -max/--maxlayer")
+    if args.zip and args.archive_format == 'tar.zst' and zstandard is None:
+        parser.error("--archive-format tar.zst needs the zstandard package: pip install zstandard")
+    # Every stage builds its paths from this one spelling of the output directory.
+    args.output = os.path.normpath(args.output)
+    # The archive is written next to the output directory rather than into the directory it archives,
+    # so the directory needs a name and a parent (e.g. '.' is resolved first, 'E:/' has neither).
+    output_dir = pathlib.Path(args.output).resolve()
+    if args.zip and (not output_dir.name or output_dir.parent == output_dir):
+        parser.error("-zip needs an output directory that is not a drive or file system root")
 
+    # Setting up logging first, so a failing stage still leaves its traceback in the log
+    os.makedirs(args.output, exist_ok=True)
+    log_file = os.path.join(args.output, 'Forge_Log.txt')
+    log_handler = logging.FileHandler(log_file, delay=True)
+    log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    # Stage threads only put records on a queue; a single listener thread writes them to the file.
+    log_queue = queue.Queue(-1)
+    log_listener = QueueListener(log_queue, log_handler)
+    log_listener.start()
+    root_logger = logging.getLogger()
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
 
+    # Log the parameters
+    logging.info(f"Input file: {args.input}")
+    logging.info(f"Output directory: {args.output}")
+    logging.info(f"Minimum zoom layer: {args.minlayer}")
+    logging.info(f"Maximum zoom layer: {args.maxlayer}")
+    if args.watermark:
+        logging.info(f"Image library: {pillow_build()}")
+        if not PILLOW_SIMD:
+            print("Watermarking with stock Pillow. Pillow-SIMD decodes and encodes tiles faster, see the README.")
 
     # Parameters for xyz_tiler
     tiler_config = {
@@ -140,17 +391,18 @@ def main():
         #"xyz_output_path": "E:/XYZ_Tiles/output",
         #"xyz_zoom_min": 1,
         #"xyz_zoom_max": 17,
-        "xyz_tile_format": 1,  # 0 for PNG, 1 for JPG
-        "xyz_dpi": 96,
+        "xyz_tile_format": 0 if args.format == 'png' else 1,  # 0 for PNG, 1 for JPG
+        "xyz_dpi": args.dpi,
         "xyz_background_color": '#FFFFFF00',
-        "xyz_quality": 95,
-        "xyz_metatilesize": 4,
+        "xyz_quality": args.quality,
+        "xyz_metatilesize": args.metatilesize,
         "xyz_tile_width": 256,
         "xyz_tile_height": 256,
         "xyz_tms_convention": False,
         "xyz_html_title": '',
         "xyz_html_attribution": '',
-        "xyz_html_osm": False
+        "xyz_html_osm": False,
+        "xyz_processes": args.processes
     }
 
     # Parameters for xyz_tile_cleaner
@@ -176,7 +428,13 @@ def main():
         "watermark_margin_bottom": 50, #10 for png
         "watermark_frequency": 6,
         "watermark_stroke_width":1, # Konturun kalınlığını ayarla
-        "watermark_stroke_fill":(0,0,0)  # Konturun rengini belirle
+        "watermark_stroke_fill":(0,0,0),  # Konturun rengini belirle
+        "watermark_quality": tiler_config['xyz_quality'],
+        # Watermarking is bound by disk reads and writes rather than CPU, so it gets its own,
+        # smaller pool than the tiler.
+        # Worker processes encode in parallel, so they use every CPU; threads mostly wait for the disk.
+        "max_workers": args.watermark_workers or (default_worker_count() if args.watermark_processes else min(default_worker_count(), 4)),
+        "watermark_processes": args.watermark_processes
     }
 
     pathsaver_config = {
@@ -185,54 +443,119 @@ def main():
 
     zipper_config = {
         "archive_path": tiler_config['xyz_output_path'],  # Directory to be zipped
-        "zip_file_path": f"{tiler_config['xyz_output_path']}/{os.path.basename(tiler_config['xyz_output_path'])}.zip"  # Destination for the zip file
-
+        "zip_file_path": str(output_dir.parent / (output_dir.name + '.' + args.archive_format)),  # Destination for the archive
+        "archive_format": args.archive_format,
+        "compression": args.zip_compression,  # Only for preview.html and tile_paths.txt, tiles are stored as they are
+        "buffer_size": 8 * 1024 * 1024
     }
 
+    if args.watermark:
+        # The watermarker runs once per zoom level; the text is rasterized only once for all of them.
+        watermarker_config['watermark_overlay'] = render_watermark_overlay(watermarker_config)
+
+    # Each zoom level is listed once; cleaning, watermarking and the path log all work from that listing.
+    zoom_scans = {}
+    cleaner_config['clear_scans'] = zoom_scans
+    watermarker_config['watermark_scans'] = zoom_scans
+    pathsaver_config['scans'] = zoom_scans
+
+    # Pipeline stages, each applied to one zoom level at a time
+    def clean_zoom_level(zoom_level):
+        zoom_level_path = os.path.join(args.output, str(zoom_level))
+        watermarked = args.watermark and zoom_level in watermarker_config['watermark_layer_levels']
+        if (args.clear or args.pathlog or watermarked) and os.path.isdir(zoom_level_path):
+            # Sizes are only needed by the cleaner.
+            zoom_scans[zoom_level] = xyz_tile_scan(zoom_level_path, sizes=bool(args.clear))
+        if args.clear and cleaner_config['clear_zoom_min'] <= zoom_level <= cleaner_config['clear_zoom_max']:
+            xyz_tile_cleaner(dict(cleaner_config, clear_zoom_min=zoom_level, clear_zoom_max=zoom_level))
+
+    def watermark_zoom_level(zoom_level):
+        if args.watermark and zoom_level in watermarker_config['watermark_layer_levels']:
+            xyz_tile_watermarker(dict(watermarker_config, watermark_layer_levels=[zoom_level]))
+        # Without a path log, nothing needs the listing any more.
+        if not args.pathlog:
+            zoom_scans.pop(zoom_level, None)
+
     # Call the functions
-    start_time = datetime.now()
+    # perf_counter is monotonic, unlike the wall clock it is not moved by clock adjustments.
+    start_time = time.perf_counter_ns()
 
-    if args.input:
-        xyz_tiler(tiler_config)
-    else:
-        print("No raster file specified. Proceeding without generating XYZ tiles. [-i  'E:/XYZ_Tiles/originals/EPB/EB1/MAGA DGBH/Maga.ecw']")
-    if args.clear:
-        xyz_tile_cleaner(cleaner_config)
-    else:
-        print("Cleainng process skipped. [-clear 1800] ")
-    if args.watermark:
-        xyz_tile_watermarker(watermarker_config)
-    else:
-        print("No watermark text specified. Proceeding without watermarking. [-mark 'example']")
-    
-    if args.pathlog:
-        xyz_tile_pathsaver(pathsaver_config)
-    else:
-        print("Path log step is skipped as per command line option [-plog].")
+    try:
+        # Stages run in their own threads and hand zoom levels downstream through queues, so a
+        # zoom level is cleaned, watermarked and archived while the next ones are still tiling.
+        clean_queue, mark_queue, done_queue = queue.Queue(), queue.Queue(), queue.Queue()
+        zip_queue = queue.Queue(maxsize=ZIP_QUEUE_SIZE)
+        errors = []
 
-    if args.zip:
-        xyz_tile_archiver(zipper_config)
-    else:
-        # skip zip process
-        print("Archiving (zipping) step is skipped as per the command line option [-zip].")
-
-    end_time = datetime.now()
-    elapsed_time = end_time - start_time
-    hours, remainder = divmod(elapsed_time.total_seconds(), 3600)
-    minutes, seconds = divmod(remainder, 60)
-    print(f"All processes have been successfully completed in '{int(hours)} hour {int(minutes)} min {int(seconds)} sec'.")
-    
-    # Setting up logging
-    log_file = os.path.join(args.output, 'Forge_Log.txt')
-    logging.basicConfig(filename=log_file, level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
+        if not args.clear:
+            print("Cleainng process skipped. [-clear 1800] ")
+        if not args.watermark:
+            print("No watermark text specified. Proceeding without watermarking. [-mark 'example']")
+        clean_thread = start_stage(clean_zoom_level, clean_queue, mark_queue, errors)
+        mark_thread = start_stage(watermark_zoom_level, mark_queue, zip_queue if args.zip else done_queue, errors)
+        if args.zip:
+            # Watermarked tiles go to the archive straight from memory instead of being read back from disk.
+            watermarker_config['watermark_sink'] = lambda file_path, tile_bytes: zip_queue.put((file_path, tile_bytes))
+            zip_thread = start_thread(errors, run_archiver, zipper_config, zip_queue)
+        pathlog_thread = None
 
-    # Log the parameters
-    logging.info(f"Input file: {args.input}")
-    logging.info(f"Output directory: {args.output}")
-    logging.info(f"Minimum zoom layer: {args.minlayer}")
-    logging.info(f"Maximum zoom layer: {args.maxlayer}")
-    logging.info(f"All processes have been successfully completed in '{int(hours)} hour {int(minutes)} min {int(seconds)} sec'.")
+        try:
+            try:
+                manifest_path = os.path.join(args.output, MANIFEST_NAME)
+                manifest = tiling_manifest(tiler_config) if args.input else None
+                if manifest and not args.force_retile and read_manifest(manifest_path) == manifest:
+                    print("Tiles of this raster and zoom range are already generated. Skipping XYZ tile generation. [--force-retile]")
+                    for zoom_level in zoom_levels_on_disk(args.output):
+                        clean_queue.put(zoom_level)
+                elif args.input:
+                    # An interrupted run must not leave a manifest that vouches for incomplete tiles.
+                    if os.path.exists(manifest_path):
+                        os.remove(manifest_path)
+                    run_tiler(tiler_config, clean_queue)
+                    if manifest:
+                        write_manifest(manifest_path, manifest)
+                else:
+                    print("No raster file specified. Proceeding without generating XYZ tiles. [-i  'E:/XYZ_Tiles/originals/EPB/EB1/MAGA DGBH/Maga.ecw']")
+                    for zoom_level in zoom_levels_on_disk(args.output):
+                        clean_queue.put(zoom_level)
+            finally:
+                clean_queue.put(None)
+                clean_thread.join()
+
+            # Tile paths are final once cleaning is done. Watermarking only changes pixels, so the
+            # path log is written while the last zoom levels are still being watermarked.
+            if args.pathlog:
+                pathlog_thread = start_thread(errors, xyz_tile_pathsaver, pathsaver_config)
+            else:
+                print("Path log step is skipped as per command line option [-plog].")
+        finally:
+            mark_queue.put(None)
+            mark_thread.join()
+            if pathlog_thread:
+                pathlog_thread.join()
+            # The archiver adds the top-level files last, so it is only released once the path log exists.
+            if args.zip:
+                zip_queue.put(None)
+                zip_thread.join()
+
+        if not args.zip:
+            # skip zip process
+            print("Archiving (zipping) step is skipped as per the command line option [-zip].")
+
+        if errors:
+            raise errors[0]
+
+        elapsed_seconds = (time.perf_counter_ns() - start_time) // 1_000_000_000
+        hours, remainder = divmod(elapsed_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        print(f"All processes have been successfully completed in '{hours} hour {minutes} min {seconds} sec'.")
+        logging.info(f"All processes have been successfully completed in '{hours} hour {minutes} min {seconds} sec'.")
+    except Exception:
+        logging.exception("Pipeline failed")
+        raise
+    finally:
+        # Writes out the records still queued and closes the log file.
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -42,34 +42,258 @@ Parameters:
     config (dict): Configuration parameters for the archiving process.
         - archive_path: Path to the directory where XYZ tiles are stored.
         - zip_file_path: Destination path for the created zip file.
+        - archive_format: Optional, 'zip' (default) or 'tar.zst'. tar.zst archives are
+          compressed as a whole with zstandard on all CPUs and need the optional
+          zstandard package. The compression options below only apply to zip archives.
+        - compression: Optional zipfile compression method for files other than tile
+          images, e.g. preview.html and tile_paths.txt (default ZIP_DEFLATED). Either a
+          zipfile constant or one of the names in COMPRESSION_METHODS. PNG, JPG and WEBP
+          files are always stored, as they are already compressed.
+        - buffer_size: Optional write buffer size of the zip file in bytes (default 8 MiB).
+    zoom_queue (queue.Queue): Only for xyz_tile_archiver_stream. Zoom levels whose
+        tiles are final or (file_path, tile_bytes) pairs of single files, followed by
+        None once nothing more will arrive.
 
 Notes:
-    - 
+    - With the optional zlib-ng package installed (pip install zlib-ng), the CRC32 of
+      the stored tiles uses its SIMD accelerated implementation.
 """
 
+import contextlib
+import io
 import os
+import tarfile
+import threading
 import zipfile
+import zlib
+
+try:
+    # Optional. zlib-ng computes CRC32 with carry-less multiplication instructions, for the
+    # members this module checksums itself.
+    from zlib_ng import zlib_ng
+except ImportError:
+    zlib_ng = None
+
+fast_zlib = zlib_ng or zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_COMPRESSION = zipfile.ZIP_DEFLATED
+COMPRESSION_METHODS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflated': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+# Archives found in the archived directory are never archived themselves.
+ARCHIVE_EXTENSIONS = ('.zip', '.tar.zst')
+# Images are already compressed, deflating them again costs CPU for almost no gain.
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+# Chunk size used when copying a file into the archive.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+class AppendOnlyFile:
+    """Write-only view of a file object that hides seek().
+
+    On a seekable file zipfile seeks back after every member to fill in its size and CRC,
+    which flushes the write buffer each time. Without seek() it appends data descriptors
+    instead, so the members reach the disk in large buffered writes.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.name = file.name
+        self.position = file.tell()
+
+    def write(self, data):
+        self.position += len(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        self.file.flush()
+
+# Copy buffer of each thread writing into an archive, see write_file().
+copy_buffers = threading.local()
+
+def write_file(zipf, file_path, arcname, compression):
+    """Copy a file into zipf in large chunks.
+
+    The file is read straight into a buffer that is reused for every file, instead of
+    allocating a new bytes object for each read.
+    """
+    buffer = getattr(copy_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = copy_buffers.buffer = memoryview(bytearray(COPY_BUFFER_SIZE))
+    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+    zinfo.compress_type = compression
+    if compression == zipfile.ZIP_STORED and zinfo.file_size < len(buffer):
+        # Small stored files, i.e. the tiles, are read whole and checksummed here.
+        with open(file_path, 'rb', buffering=0) as source:
+            size = source.readinto(buffer)
+        write_member(zipf, zinfo, buffer[:size])
+        return
+    with open(file_path, 'rb', buffering=0) as source, zipf.open(zinfo, 'w') as member:
+        while True:
+            size = source.readinto(buffer)
+            if not size:
+                break
+            member.write(buffer[:size])
+
+def member_compression(zipf, arcname):
+    """Compression method of the archive member arcname: stored for images, the archive's method otherwise."""
+    return zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS) else zipf.compression
+
+def write_member(zipf, zinfo, data):
+    """Write data as a stored member into zipf, as ZipFile.writestr() would have written it.
+
+    The CRC32 is computed with zlib-ng when it is installed, and as the sizes are known up
+    front the local header needs no data descriptor.
+    """
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.CRC = fast_zlib.crc32(data)
+    zinfo.file_size = zinfo.compress_size = len(data)
+    zinfo.header_offset = zipf.fp.tell()
+    zipf.fp.write(zinfo.FileHeader())
+    zipf.fp.write(data)
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+    zipf.start_dir = zipf.fp.tell()
+
+def archive_file_path(archive):
+    """Path of the file an open zip or tar archive is written to."""
+    return archive.filename if isinstance(archive, zipfile.ZipFile) else archive.name
+
+def add_file_to_archive(archive, file_path, arcname):
+    if isinstance(archive, zipfile.ZipFile):
+        write_file(archive, file_path, arcname, member_compression(archive, arcname))
+    else:
+        archive.add(file_path, arcname, recursive=False)
+
+def add_bytes_to_archive(archive, file_path, arcname, data):
+    """Add the file at file_path to archive, with data as its content."""
+    if isinstance(archive, zipfile.ZipFile):
+        compression = member_compression(archive, arcname)
+        if compression == zipfile.ZIP_STORED:
+            write_member(archive, zipfile.ZipInfo.from_file(file_path, arcname), data)
+        else:
+            archive.writestr(arcname, data, compress_type=compression)
+    else:
+        tarinfo = archive.gettarinfo(file_path, arcname)
+        tarinfo.size = len(data)
+        archive.addfile(tarinfo, io.BytesIO(data))
+
+def add_directory_to_archive(archive, folder_path, archive_path, written=()):
+    """Write every file below folder_path into archive, named relative to archive_path.
+
+    Files whose archive names are in written are already in the archive and are skipped, as is the
+    archive file itself should it be located below folder_path.
+    """
+    for file_path, arcname in iter_archive_files(archive_file_path(archive), folder_path, archive_path, written):
+        add_file_to_archive(archive, file_path, arcname)
+
+def iter_archive_files(output_path, folder_path, archive_path, written=()):
+    """List the (file_path, arcname) pairs of add_directory_to_archive()."""
+    # The archive itself only needs to be looked for if it is written below folder_path.
+    output_path = os.path.abspath(output_path) if output_path else None
+    if output_path and not output_path.startswith(os.path.join(os.path.abspath(folder_path), '')):
+        output_path = None
+    stack = [(folder_path, os.path.relpath(folder_path, archive_path))]
+    while stack:
+        directory, arc_directory = stack.pop()
+        prefix = '' if arc_directory == '.' else arc_directory + '/'
+        # Ana klasördeki arşiv dosyalarını hariç tut
+        skip_archives = directory == archive_path
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    stack.append((entry.path, prefix + name))
+                    continue
+                # Skip the forge's own bookkeeping files (.forge_manifest.json, .forge_watermarked)
+                arcname = prefix + name
+                if name.startswith('.forge') or (skip_archives and name.endswith(ARCHIVE_EXTENSIONS)) or arcname in written:
+                    continue
+                if output_path and name.endswith(ARCHIVE_EXTENSIONS) and os.path.abspath(entry.path) == output_path:
+                    continue
+                yield entry.path, arcname
+
+@contextlib.contextmanager
+def open_archive(config):
+    """Open the archive described by config for writing, a ZipFile or a TarFile."""
+    zip_file_path = config['zip_file_path']
+    archive_format = config.get('archive_format', 'zip')
+    compression = config.get('compression', DEFAULT_COMPRESSION)
+    compression = COMPRESSION_METHODS.get(compression, compression)
+    buffer_size = config.get('buffer_size', DEFAULT_BUFFER_SIZE)
+
+    with open(zip_file_path, 'wb', buffering=buffer_size) as archive_file:
+        if archive_format == 'tar.zst':
+            if zstandard is None:
+                raise ImportError("The tar.zst archive format requires the zstandard package (pip install zstandard).")
+            # threads=-1 compresses on as many threads as there are CPUs.
+            compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+            with compressor.stream_writer(archive_file, closefd=False) as zstd_file, \
+                    tarfile.open(zip_file_path, 'w|', fileobj=zstd_file) as tar:
+                yield tar
+        else:
+            with zipfile.ZipFile(AppendOnlyFile(archive_file), 'w', compression=compression, allowZip64=True) as zipf:
+                yield zipf
 
 def xyz_tile_archiver(config):
     archive_path = config['archive_path']
     zip_file_path = config['zip_file_path']
-    
-    # Function to zip the directory
-    def zip_directory(folder_path, zip_path):
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(folder_path):
-                # Ana klasördeki zip dosyalarını hariç tut
-                if root == folder_path:
-                    files = [f for f in files if not f.endswith('.zip')]
-
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    zipf.write(file_path, os.path.relpath(file_path, archive_path))
 
     print(f"Archiving tiles from {archive_path} to {zip_file_path}...")
-    zip_directory(archive_path, zip_file_path)
+    with open_archive(config) as archive:
+        add_directory_to_archive(archive, archive_path, archive_path)
     print("Archiving process completed.")
 
+def xyz_tile_archiver_stream(config, zoom_queue):
+    """Archive zoom level directories as they arrive on zoom_queue.
+
+    Each zoom level is written into the archive as soon as the previous pipeline stages
+    put it on the queue. A (file_path, tile_bytes) item writes a single file from
+    memory, e.g. a tile the watermarker has just encoded; that file is then skipped
+    when its zoom level arrives. Once None is received, the remaining files and
+    directories of archive_path are added and the archive is closed.
+    """
+    archive_path = config['archive_path']
+    zip_file_path = config['zip_file_path']
+    archived = set()
+    written = set()
+
+    print(f"Archiving tiles from {archive_path} to {zip_file_path} as zoom levels complete...")
+    with open_archive(config) as archive:
+        while True:
+            item = zoom_queue.get()
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                file_path, tile_bytes = item
+                # Keyed by archive name, so differently spelled paths of one file still match.
+                arcname = os.path.relpath(file_path, archive_path).replace(os.sep, '/')
+                add_bytes_to_archive(archive, file_path, arcname, tile_bytes)
+                written.add(arcname)
+                continue
+            add_directory_to_archive(archive, os.path.join(archive_path, str(item)), archive_path, written)
+            archived.add(str(item))
+
+        # Top-level files (preview.html, tile_paths.txt, ...) are only complete at the end.
+        for entry in os.scandir(archive_path):
+            if entry.name in archived:
+                continue
+            if entry.is_dir():
+                add_directory_to_archive(archive, entry.path, archive_path)
+            elif not entry.name.endswith(ARCHIVE_EXTENSIONS) and not entry.name.startswith('.forge'):
+                add_file_to_archive(archive, entry.path, entry.name)
+    print("Archiving process completed.")
 
 
 if __name__ == "__main__":
@@ -43,34 +43,55 @@ Parameters:
         - clear_size_min: Minimum file size (in bytes) for tiles to be retained.
         - clear_zoom_min: Minimum zoom level at which cleaning should start.
         - clear_zoom_max: Maximum zoom level at which cleaning should end.
+        - clear_workers: Optional number of threads deleting tiles at once (default 32).
+          Deletions mostly wait on the file system, so many of them can be in flight.
+        - clear_scans: Optional dict of zoom level to xyz_tile_scan() listing, preferably
+          made with sizes=True. Listed zoom levels are cleaned from the listing instead of
+          being walked again, and the deleted tiles are removed from it. Other zoom levels
+          are listed with xyz_tile_scan() here.
 
 Notes:
     - Backup your tile data before the cleaning process, especially if applying
       script to a production dataset.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import os
+from xyz_tile_scanner import is_tile_name, xyz_tile_scan
+
+DEFAULT_WORKERS = 32
 
 def xyz_tile_cleaner(config):
     clear_path = config['clear_path']
-    clear_size_min = int(config['clear_size_min'])
+    clear_size_min = config['clear_size_min']
     clear_zoom_min = config['clear_zoom_min']
     clear_zoom_max = config['clear_zoom_max']
-    
-    # Function to delete tiles smaller than the specified size
-    def delete_small_tiles(directory, size_threshold):
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.getsize(file_path) < size_threshold:
-                    os.remove(file_path)
+    clear_workers = config.get('clear_workers', DEFAULT_WORKERS)
+    clear_scans = config.get('clear_scans', {})
+
+    # Function to delete the tiles of an xyz_tile_scan() listing smaller than the specified size
+    def delete_small_tiles(listing, size_threshold):
+        # Deleting is I/O bound and unlink releases the GIL, so several deletions are kept in flight at once.
+        # Finding the small tiles stays serial, only the deletions are spread over the threads.
+        with ThreadPoolExecutor(max_workers=clear_workers) as executor:
+            for directory, files in listing:
+                # Listings made without sizes fall back to a stat per tile.
+                small_tiles = [name for name, size in files if is_tile_name(name) and
+                               (os.stat(os.path.join(directory, name), follow_symlinks=False).st_size if size is None else size) < size_threshold]
+                if not small_tiles:
+                    continue
+                for _ in executor.map(os.unlink, [os.path.join(directory, name) for name in small_tiles]):
+                    pass
+                deleted = set(small_tiles)
+                files[:] = [file for file in files if file[0] not in deleted]
 
     # Iterate over specified zoom levels and clean tiles
     for zoom_level in range(clear_zoom_min, clear_zoom_max + 1):
         zoom_level_path = os.path.join(clear_path, str(zoom_level))
         if os.path.exists(zoom_level_path):
             print(f"Cleaning tiles in zoom level {zoom_level}...")
-            delete_small_tiles(zoom_level_path, clear_size_min)
+            listing = clear_scans[zoom_level] if zoom_level in clear_scans else xyz_tile_scan(zoom_level_path, sizes=True)
+            delete_small_tiles(listing, clear_size_min)
         else:
             print(f"Zoom level {zoom_level} directory does not exist. Skipping...")
 
@@ -39,6 +39,8 @@ Usage:
 Parameters:
     config (dict): Configuration parameters for the path saving process.
         - scan_path: Path to the directory where XYZ tiles stored.
+        - scans: Optional dict of zoom level to xyz_tile_scan() listing. The paths of
+          listed zoom levels are taken from the listing instead of walking them again.
 Notes:
     - 
 """
@@ -47,22 +49,54 @@ import os
 
 import os
 
+# Tile extensions, compared against the last four bytes of a file name
+TILE_SUFFIXES = frozenset((b'.jpg', b'.png'))
+LINE_END = os.linesep.encode()
+
 def xyz_tile_pathsaver(config):
     scan_path = config['scan_path']
     output_file_path = os.path.join(scan_path, 'tile_paths.txt')
-    all_paths = []  # Dosya yollarını tutacak liste
+    all_paths = bytearray()  # Dosya yollarını tutacak tampon
+    scans = {os.fsencode(str(zoom_level)): listing for zoom_level, listing in config.get('scans', {}).items()}
 
-    with open(output_file_path, 'w') as output_file:
-        for root, dirs, files in os.walk(scan_path):
-            relative_root = os.path.relpath(root, scan_path)  # root'un scan_path'e göre relative yolu
-            for file in files:
-                if file.lower().endswith(('.jpg', '.png')):
-                    # Dosya yolunu relative olarak ekle uzantısı ile birlikte (.jpeg, .jpg veya .png)
-                    relative_file_path = os.path.join(relative_root, file) if relative_root != "." else file
-                    all_paths.append(relative_file_path + '\n')
+    # Scanning a bytes path yields bytes names, so the file is built without decoding and
+    # re-encoding every name. os.scandir() returns the file types together with the names,
+    # so no file is stat'ed. Directories are visited depth-first in listing order, like os.walk() does.
+    separator = os.sep.encode()
+    stack = [(os.fsencode(scan_path), b"", None)]
+    while stack:
+        directory, prefix, listing = stack.pop()  # prefix: directory'nin scan_path'e göre relative yolu ve ayırıcı
+        if listing is not None:
+            for listed_directory, files in listing:
+                prefix = os.fsencode(os.path.relpath(listed_directory, scan_path)) + separator
+                for file_name, _ in files:
+                    name = os.fsencode(file_name)
+                    if name[-4:] in TILE_SUFFIXES or name[-4:].lower() in TILE_SUFFIXES:
+                        all_paths += prefix
+                        all_paths += name
+                        all_paths += LINE_END
+            continue
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    # Zoom level directories are top-level, only they can have a listing.
+                    subdirectories.append((entry.path, prefix + name + separator, None if prefix else scans.get(name)))
+                # Tiles have lowercase extensions, so lowercasing is only tried for the rest.
+                elif name[-4:] in TILE_SUFFIXES or name[-4:].lower() in TILE_SUFFIXES:
+                    # Dosya yolunu relative olarak ekle uzantısı ile birlikte (.jpg veya .png)
+                    all_paths += prefix
+                    all_paths += name
+                    all_paths += LINE_END
+        stack.extend(reversed(subdirectories))
 
-        # Tüm yolları bir kerede dosyaya yaz
-        output_file.writelines(all_paths)
+    # Tüm yolları bir kerede dosyaya yaz. The paths are already in one buffer, so the file is
+    # opened unbuffered and written directly from it; a raw write may write only part of it.
+    with open(output_file_path, 'wb', buffering=0) as output_file:
+        remaining = memoryview(all_paths)
+        while remaining:
+            remaining = remaining[output_file.write(remaining):]
 
     print(f"Paths of XYZ tiles have been saved to {output_file_path}")
 
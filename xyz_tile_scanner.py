@@ -0,0 +1,94 @@
+"""
+/***************************************************************************
+                                XYZ Tile Scanner
+ Lists a tile directory once for all the steps that work on its tiles.
+
+ The XYZ Tile Scanner script walks the directory tree of a zoom level and
+ records the files of every directory. The cleaner, watermarker and path
+ saver can all work from this one listing instead of each walking the same
+ tree again.
+
+                              -------------------
+        author               : burak üstüner
+        date                 : 2024-02
+        email                : burakustuner@gmail.com
+        github               : github.com/burakustuner
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                        *
+ * This script is shared with the spirit of open collaboration and        *
+ * improvement. You're encouraged to use, tweak, fold, spindle, or even   *
+ * mutilate it as you see fit under the generous terms of the GNU General *
+ * Public License (GPL) version 3 or later. For the full terms, check out *
+ * the GPL on the Free Software Foundation's website.                     *
+
+ * Feel free to reach out if you have any questions, suggestions, or just *
+ * want to chat about this project. I'm always open to discussing new     *
+ * ideas, collaboration, or helping out where I can.                      *
+ *                                                                        *
+ ***************************************************************************/
+
+Usage:
+    - Call xyz_tile_scan() with a zoom level directory and pass the result to
+      the other steps (clear_scans, watermark_scans and scans in their configs).
+
+Parameters:
+    directory (str): Directory to list, usually one zoom level of the output.
+    sizes (bool): Optional, also record the size of every file (default False). Free
+        on Windows, where the directory listing includes the sizes; one stat per file
+        elsewhere.
+
+Notes:
+    - The listing is a list of (directory_path, files) pairs, one for every directory
+      below and including the given one. files is a list of (file_name, size) pairs,
+      size is None unless sizes were asked for. Directories are visited depth-first,
+      x directories and y tiles in numeric order.
+    - Steps that delete files (the cleaner) remove them from files, so the listing
+      stays valid for the steps after them.
+"""
+
+import os
+
+# Extensions of tile images, lowercase and without the dot. Other files, like
+# .forge_watermarked, are never treated as tiles.
+TILE_EXTENSIONS = frozenset(('png', 'jpg', 'jpeg'))
+
+def is_tile_name(name):
+    """Whether a file name has a tile image extension. Only the extension is lowercased, not the whole name."""
+    dot = name.rfind('.')
+    return dot >= 0 and name[dot + 1:].lower() in TILE_EXTENSIONS
+
+def tile_sort_key(name):
+    """Sort key ordering XYZ directory and tile names numerically (2 before 10), others after them.
+
+    Visiting x directories and y tiles in numeric order keeps neighbouring tiles together,
+    which suits the disk's readahead.
+    """
+    stem = name.split('.', 1)[0]
+    return (0, int(stem), name) if stem.isdigit() else (1, 0, name)
+
+def xyz_tile_scan(directory, sizes=False):
+    listing = []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        subdirectories = []
+        files = []
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.name)
+                else:
+                    files.append((entry.name, entry.stat(follow_symlinks=False).st_size if sizes else None))
+        files.sort(key=lambda file: tile_sort_key(file[0]))
+        listing.append((current, files))
+        subdirectories.sort(key=tile_sort_key, reverse=True)
+        stack.extend(os.path.join(current, name) for name in subdirectories)
+    return listing
+
+
+if __name__ == "__main__":
+    # Example usage for testing
+    for directory_path, files in xyz_tile_scan("path/to/output/directory/14"):
+        print(directory_path, len(files))
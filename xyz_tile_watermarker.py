@@ -49,63 +49,307 @@ Parameters:
         - watermark_margin_left: Left margin for the watermark text positioning.
         - watermark_margin_bottom: Bottom margin for the watermark text positioning.
         - watermark_frequency: Frequency of watermarking tiles (e.g., every 5th tile).
+        - watermark_quality: Optional JPG quality used when re-saving watermarked JPG tiles.
+          Should match the quality the tiles were generated with (default 95).
+        - watermark_png_compress_level: Optional zlib level (0-9) used when re-saving
+          watermarked PNG tiles (default 1, fastest).
+        - max_workers: Optional number of threads watermarking tiles at once (default 4).
+          Watermarking is mostly disk reads and writes, so more threads than the disk can
+          serve only slow it down.
+        - watermark_processes: Optional, watermark in max_workers worker processes instead
+          of threads (default False). Pays off when encoding rather than the disk is the
+          bottleneck, e.g. for PNG tiles on a fast disk.
+        - watermark_sink: Optional callable sink(file_path, tile_bytes), called with the
+          encoded bytes of every watermarked tile (e.g. to archive it without reading
+          the file again).
+        - watermark_scans: Optional dict of zoom level to xyz_tile_scan() listing. Tiles of
+          listed zoom levels are selected from the listing instead of walking them again.
+          Other zoom levels are listed with xyz_tile_scan() here.
+        - watermark_overlay: Optional result of render_watermark_overlay(config). Pass it
+          to render the text only once when the watermarker is called repeatedly.
 
 Notes:
+    - Watermarking is bound by decoding and encoding the tiles. Pillow-SIMD and a
+      libjpeg-turbo build speed it up without code changes, see pillow_build() and the
+      README.
+    - Watermarked zoom levels are marked with a .forge_watermarked file and skipped on
+      later runs, until their tiles are generated again.
     - It's good idea to check the final result to make sure the watermarks don't hide
       important details on your tiles.
 """
 
-from PIL import Image, ImageDraw, ImageFont
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import itertools
+import PIL
+from PIL import Image, ImageDraw, ImageFont, features
+import io
 import os
+import zlib
+from xyz_tile_scanner import is_tile_name, xyz_tile_scan
+
+# Written into a zoom level directory once its tiles are watermarked, so re-runs don't stamp them twice.
+WATERMARK_SENTINEL = '.forge_watermarked'
+# Tiles sent to a watermarking worker process at once, to keep the inter-process traffic low.
+WORKER_BATCH_SIZE = 64
+# Tasks submitted per worker ahead of the one whose result is consumed, see bounded_map().
+TASKS_PER_WORKER = 2
+
+# Pillow-SIMD versions end in .postN (e.g. 9.5.0.post1), stock Pillow versions do not.
+PILLOW_SIMD = '.post' in PIL.__version__
+
+def pillow_build():
+    """Describe the Pillow build that decodes and encodes the tiles, e.g. 'Pillow-SIMD 9.5.0.post1, libjpeg-turbo 2.1.5'."""
+    name = 'Pillow-SIMD' if PILLOW_SIMD else 'Pillow'
+    turbo_version = features.version_feature('libjpeg_turbo')
+    jpeg = f"libjpeg-turbo {turbo_version}" if turbo_version else "no libjpeg-turbo"
+    return f"{name} {PIL.__version__}, {jpeg}"
+
+def clear_watermark_sentinel(level_path):
+    """Forget that the tiles in level_path were watermarked, e.g. because they are generated again."""
+    sentinel_path = os.path.join(level_path, WATERMARK_SENTINEL)
+    if os.path.exists(sentinel_path):
+        os.remove(sentinel_path)
+
+@functools.lru_cache(maxsize=32)
+def load_watermark_font(font_path, font_size):
+    """Load a TrueType font, falling back to Pillow's default font. Each font is parsed only once per process."""
+    try:
+        return ImageFont.truetype(font_path, font_size)
+    except IOError:
+        print("Fallback to default font.")
+        return ImageFont.load_default()
+
+def render_watermark_overlay(config):
+    """Rasterize the watermark text once, so it can be stamped onto any number of tiles.
+
+    Returns (offset, stroke_mask, text_mask). stroke_mask covers the text together with its
+    stroke (None without a stroke), text_mask the text alone, and offset is the top-left corner
+    of both masks relative to the text position. Stamping the stroke color through stroke_mask
+    and then the text color through text_mask gives the same pixels as ImageDraw.text() with a stroke.
+    """
+    text = config['watermark_text']
+    stroke_width = config['watermark_stroke_width']
+    font = load_watermark_font(config['watermark_font_path'], config['watermark_font_size'])
+
+    left, top, right, bottom = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), text, font=font, stroke_width=stroke_width)
+    size = (right - left, bottom - top)
+    origin = (-left, -top)
+    stroke_mask = None
+    if stroke_width:
+        stroke_mask = Image.new('L', size, 0)
+        ImageDraw.Draw(stroke_mask).text(origin, text, fill=255, font=font, stroke_width=stroke_width, stroke_fill=255)
+    text_mask = Image.new('L', size, 0)
+    ImageDraw.Draw(text_mask).text(origin, text, fill=255, font=font)
+    return (left, top), stroke_mask, text_mask
+
+def make_stamper(stamp):
+    """Return stamp_tile(image_path), which stamps the watermark onto the tile at image_path and saves it.
+
+    stamp holds the overlay of render_watermark_overlay() together with the margins, colors
+    and per-format save options the watermarker was configured with, and the text and font
+    that tiles other than RGB or RGBA are drawn with. They are unpacked once here, so stamping
+    a tile reads them from the closure instead of looking them up in stamp.
+    stamp_tile returns the encoded tile. If the watermark does not change any pixel of the
+    tile (e.g. white text on a white tile, or margins placing it outside the tile), the tile
+    is not re-encoded and None is returned.
+    """
+    (offset_x, offset_y), stroke_mask, text_mask = stamp['overlay']
+    margin_left = stamp['margin_left']
+    margin_bottom = stamp['margin_bottom']
+    x = margin_left + offset_x
+    y_from_bottom = margin_bottom - offset_y
+    mask_width, mask_height = text_mask.size
+    stroke_fill = stamp['stroke_fill']
+    text_color = stamp['text_color']
+    save_options = stamp['save_options']
+    text = stamp['text']
+    font_path, font_size = stamp['font']
+    stroke_width = stamp['stroke_width']
+
+    def stamp_tile(image_path):
+        # The tile is opened once, for reading it and for writing it back.
+        with open(image_path, 'r+b') as tile_file:
+            with Image.open(tile_file) as img:
+                width, height = img.size
+                position = (x, height - y_from_bottom)
+                # Only the pixels under the masks can change, so comparing them is enough.
+                box = position + (x + mask_width, position[1] + mask_height)
+                # Opening reads only the header, a watermark outside the tile is rejected before
+                # any pixel is decoded.
+                if box[0] >= width or box[1] >= height or box[2] <= 0 or box[3] <= 0:
+                    return None
+                original = img.crop(box).tobytes()
+                if img.mode in ('RGB', 'RGBA'):
+                    if stroke_mask is not None:
+                        img.paste(stroke_fill, position, stroke_mask)
+                    img.paste(text_color, position, text_mask)
+                else:
+                    # Other modes (e.g. palette PNGs) need the colors mapped to the tile's mode and,
+                    # for palettes, text without anti-aliasing, which ImageDraw takes care of.
+                    font = load_watermark_font(font_path, font_size)
+                    ImageDraw.Draw(img).text((margin_left, height - margin_bottom), text,
+                                             fill=text_color, font=font, stroke_width=stroke_width, stroke_fill=stroke_fill)
+                if img.crop(box).tobytes() == original:
+                    return None
+                # The tile is encoded once in memory, so a sink gets the same bytes without reading the file back.
+                encoded = io.BytesIO()
+                img.save(encoded, format=img.format, **save_options.get(img.format, {}))
+            tile_bytes = encoded.getvalue()
+            tile_file.seek(0)
+            tile_file.write(tile_bytes)
+            tile_file.truncate()
+        return tile_bytes
+
+    return stamp_tile
+
+# Watermark stamper of the current worker process, set once by init_watermark_worker().
+_worker_stamp_tile = None
+_worker_returns_tiles = False
+
+def init_watermark_worker(stamp, return_tiles):
+    """Initializer of the watermarking worker processes."""
+    global _worker_stamp_tile, _worker_returns_tiles
+    # Closures can't be sent to other processes, so each worker builds its own from stamp.
+    _worker_stamp_tile = make_stamper(stamp)
+    _worker_returns_tiles = return_tiles
+
+def watermark_tiles_in_worker(image_paths):
+    results = []
+    for image_path in image_paths:
+        tile_bytes = _worker_stamp_tile(image_path)
+        if tile_bytes is not None and not _worker_returns_tiles:
+            # Nobody needs the tile itself, only whether it was changed.
+            tile_bytes = b''
+        results.append((image_path, tile_bytes))
+    return results
+
+def bounded_map(executor, fn, items, window):
+    """Like executor.map(fn, items), but with at most window tasks submitted and not yet consumed.
+
+    Executor.map() submits every item at once, so the workers keep encoding tiles, and their
+    results stay in memory, while the caller is blocked (e.g. by a full archiver queue). Here a
+    new task is only submitted when the result of an earlier one is taken.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+def batched(items, size):
+    """Split items into lists of at most size items."""
+    items = iter(items)
+    while batch := list(itertools.islice(items, size)):
+        yield batch
 
 def xyz_tile_watermarker(config):
     watermark_directory = config['watermark_directory']
     watermark_text = config['watermark_text']
     watermark_layer_levels = config['watermark_layer_levels']
-    watermark_font_path = config['watermark_font_path']
-    watermark_font_size = config['watermark_font_size']
     watermark_text_color = config['watermark_text_color']
     watermark_margin_left = config['watermark_margin_left']
     watermark_margin_bottom = config['watermark_margin_bottom']
     watermark_frequency = config['watermark_frequency']
-    watermark_stroke_width = config['watermark_stroke_width']
     watermark_stroke_fill = config['watermark_stroke_fill']
+    watermark_quality = config.get('watermark_quality', 95)
+    watermark_png_compress_level = config.get('watermark_png_compress_level', 1)
+    watermark_sink = config.get('watermark_sink')
+    watermark_max_workers = config.get('max_workers', 4)
+    watermark_processes = config.get('watermark_processes', False)
+    watermark_scans = config.get('watermark_scans', {})
+    # The text is rasterized once, each tile only gets the prepared masks stamped onto it.
+    watermark_overlay = config.get('watermark_overlay') or render_watermark_overlay(config)
 
-    # Function to add watermark to an image
-    def add_watermark_to_image(image_path, text, position, font, color, stroke_width, stroke_fill):
-        with Image.open(image_path) as img:
-            drawable = ImageDraw.Draw(img)
-            drawable.text(position, text, fill=color, font=font, stroke_width=stroke_width, stroke_fill=stroke_fill)
-            img.save(image_path)
-
-    # Function to process all images in a directory
-    def process_directory(directory):
-        for root, dirs, files in os.walk(directory):
-            for index, filename in enumerate(files):
-                # Apply watermark only to specific file types and based on the frequency config               
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')) and index % watermark_frequency == 0:
-                    file_path = os.path.join(root, filename)
-                    try:
-                        font = ImageFont.truetype(watermark_font_path, watermark_font_size)
-                    except IOError:
-                        font = ImageFont.load_default()
-                        print("Fallback to default font.")
-
-                    img = Image.open(file_path)
-
-                    position = (watermark_margin_left, img.height - watermark_margin_bottom)
-                    add_watermark_to_image(file_path, watermark_text, position, font, watermark_text_color,watermark_stroke_width,watermark_stroke_fill)
-                    img.close()
-                    print(f"Watermark added to {file_path}")
+    stamp = {
+        'margin_left': watermark_margin_left,
+        'margin_bottom': watermark_margin_bottom,
+        'overlay': watermark_overlay,
+        'text': watermark_text,
+        'font': (config['watermark_font_path'], config['watermark_font_size']),
+        'stroke_width': config['watermark_stroke_width'],
+        'stroke_fill': watermark_stroke_fill,
+        'text_color': watermark_text_color,
+        'save_options': {
+            # Pillow re-encodes JPG at quality 75 unless told otherwise. The tile keeps the chroma
+            # subsampling it was generated with, instead of whatever Pillow picks for the quality.
+            'JPEG': {'quality': watermark_quality, 'subsampling': 'keep'},
+            # The watermark changes only a few pixels, the full deflate effort of the default
+            # level 6 costs about three times the encoding time for a few percent of size.
+            # Run-length matching skips deflate's search for distant matches, which rarely
+            # exist in filtered tile rows.
+            'PNG': {'compress_level': watermark_png_compress_level, 'compress_type': zlib.Z_RLE},
+        },
+    }
 
-    # Process each zoom level directory
-    for level in watermark_layer_levels:
-        level_path = os.path.join(watermark_directory, str(level))
-        if os.path.exists(level_path):
-            print(f"Processing zoom level {level}...")
-            process_directory(level_path)
+    stamp_tile = make_stamper(stamp)
+
+    def watermark_tile(file_path):
+        return file_path, stamp_tile(file_path)
+
+    # Function to list the images of an xyz_tile_scan() listing that get a watermark, based
+    # on the frequency config. Only tiles are counted, so other files (e.g. Thumbs.db) don't
+    # shift the frequency.
+    def select_tiles(listing):
+        for directory, files in listing:
+            tile_names = [name for name, _ in files if is_tile_name(name)]
+            for name in tile_names[::watermark_frequency]:
+                yield os.path.join(directory, name)
+
+    # Function to process all images in a directory, returns the number of watermarked tiles
+    def process_directory(directory, executor, listing=None):
+        tiles = select_tiles(xyz_tile_scan(directory) if listing is None else listing)
+        window = watermark_max_workers * TASKS_PER_WORKER
+        if watermark_processes:
+            batches = bounded_map(executor, watermark_tiles_in_worker, batched(tiles, WORKER_BATCH_SIZE), window)
+            results = itertools.chain.from_iterable(batches)
         else:
-            print(f"Zoom level {level} directory does not exist. Skipping...")
+            results = bounded_map(executor, watermark_tile, tiles, window)
+        # Tiles are only counted, printing every one of them costs more than watermarking it
+        # on a Windows console.
+        watermarked = 0
+        for file_path, tile_bytes in results:
+            if tile_bytes is None:
+                # The tile is left as it is and gets archived from disk.
+                continue
+            if watermark_sink is not None:
+                watermark_sink(file_path, tile_bytes)
+            watermarked += 1
+        return watermarked
+
+    if watermark_processes:
+        # Each worker process gets the watermark once; only the tile paths, and the encoded
+        # tiles if a sink wants them, cross the process boundary.
+        executor = ProcessPoolExecutor(max_workers=watermark_max_workers, initializer=init_watermark_worker,
+                                       initargs=(stamp, watermark_sink is not None))
+    else:
+        # Pillow releases the GIL while decoding and encoding, so threads overlap the tile reads,
+        # encodes and writes without the cost of sending tiles to other processes.
+        executor = ThreadPoolExecutor(max_workers=watermark_max_workers)
+
+    # Process each zoom level directory
+    with executor:
+        for level in watermark_layer_levels:
+            level_path = os.path.join(watermark_directory, str(level))
+            sentinel_path = os.path.join(level_path, WATERMARK_SENTINEL)
+            if os.path.exists(sentinel_path):
+                with open(sentinel_path, encoding='utf-8') as sentinel:
+                    marked_text = sentinel.read()
+                if marked_text != watermark_text:
+                    print(f"Zoom level {level} is already watermarked with '{marked_text}'. Regenerate its tiles to change the watermark. Skipping...")
+                else:
+                    print(f"Zoom level {level} is already watermarked. Skipping...")
+            elif os.path.exists(level_path):
+                print(f"Processing zoom level {level}...")
+                watermarked = process_directory(level_path, executor, watermark_scans.get(level))
+                print(f"Watermark added to {watermarked} tiles of zoom level {level}.")
+                with open(sentinel_path, 'w', encoding='utf-8') as sentinel:
+                    sentinel.write(watermark_text)
+            else:
+                print(f"Zoom level {level} directory does not exist. Skipping...")
 
     print("Watermarking process completed.")
 
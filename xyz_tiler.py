@@ -48,6 +48,9 @@ Functionality:
     automates the process of tile generation for web mapping applications, exporting
     tiles for a range of zoom levels specified in the configuration.
 
+    To tile several rasters at once, pass one config per raster to xyz_tile_many(),
+    which runs them in parallel worker processes.
+
 Parameters:
     config (dict): Configuration parameters for the tile generation process.
         - qgis_main_path: Path to the QGIS installation directory.
@@ -63,6 +66,16 @@ Parameters:
         - xyz_tile_width: Width of each tile in pixels.
         - xyz_tile_height: Height of each tile in pixels.
         - xyz_tms_convention: Whether to use TMS tile naming convention.
+        - xyz_processes: Number of worker processes main.py tiles the zoom levels with; QGIS
+          renders with its default number of threads in each of them.
+        - xyz_extent: Optional (lon_min, lat_min, lon_max, lat_max) extent to tile in
+          EPSG:4326, see raster_extent_wgs84(). Derived from the raster when omitted.
+        - xyz_output_html: Optional path of the leaflet preview page. Defaults to
+          preview.html in the output directory; an empty value skips the preview.
+          write_preview_html() writes the same page when a zoom range is tiled in several jobs.
+    qgs (QgsApplication, optional): Running QGIS application to reuse. When omitted,
+        xyz_tiler starts its own application and exits it when tiling is done. To tile
+        several rasters with one application, use XyzTilerSession.
 
 Notes:
     - The script requires QGIS to be installed and properly configured on the system.
@@ -70,9 +83,20 @@ Notes:
     - The script's performance depends on the size of the raster dataset and the system's specifications.
 """
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import functools
+import math
+import pathlib
 import sys
 import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
     # Determine if the qgis or qgis-ltr version installed on system.
+@functools.lru_cache(maxsize=None)
 def get_qgis_ltr(base_path, sub_path):
     # Attempt to use the qgis-ltr directory first
     paths = ["qgis-ltr", "qgis"]
@@ -87,9 +111,6 @@ def add_to_sys_path(path):
     """Append the given path to sys.path if it's not already included."""
     if path not in sys.path:
         sys.path.append(path)
-        print(path +" added to sys.path")
-    else:
-        print(path +" already in sys.path")
 
 def configure_qgis_paths(qgis_main_path):
     """Configures paths related to QGIS to be included in Python's sys.path."""
@@ -106,11 +127,7 @@ def configure_qgis_paths(qgis_main_path):
         add_to_sys_path(path)
 
 def set_environment_variable(key, value):
-    """Set or update an environment variable and notify about the change."""
-    if key in os.environ:
-        print(f"{key} environment variable updated.")
-    else:
-        print(f"{key} environment variable set.")
+    """Set or update an environment variable."""
     os.environ[key] = value
 
 def configure_environment_variables(qgis_main_path):
@@ -121,54 +138,268 @@ def configure_environment_variables(qgis_main_path):
     python_home_path = os.path.join(qgis_main_path, "apps", "Python39")
     python_path = os.path.join(qgis_main_path, "apps", "Python39", "lib", "site-packages")
 
-    print(qt_plugin_path);
-    print(qgis_bin_path);
-    print(qt_bin_path);
-    print(python_home_path);
-    print(python_path);
-
+    # QGIS directories already on PATH are not added again, so PATH doesn't grow with every call.
+    path_entries = os.environ.get('PATH', '').split(os.pathsep) + [qgis_bin_path, qt_bin_path]
     env_vars = {
         'QT_QPA_PLATFORM_PLUGIN_PATH': qt_plugin_path,
         'PYTHONHOME': python_home_path,
         'PYTHONPATH': python_path,
-        'PATH': os.environ.get('PATH', '') + ";" + qgis_bin_path + ";" + qt_bin_path
+        'PATH': os.pathsep.join(dict.fromkeys(entry for entry in path_entries if entry))
     }
     for key, value in env_vars.items():
         set_environment_variable(key, value)
 
-def xyz_tiler(config):
+def raster_extent_wgs84(raster_path):
+    """Return the extent of a raster file as (lon_min, lat_min, lon_max, lat_max) in EPSG:4326.
+
+    Reads only the raster header with GDAL, which ships with QGIS. Returns None when GDAL is not
+    importable or the raster has no georeference; xyz_tiler then derives the extent itself.
+    """
+    try:
+        from osgeo import gdal, osr
+    except ImportError:
+        return None
+    dataset = gdal.Open(raster_path)
+    if dataset is None or not dataset.GetProjection():
+        return None
+    x_origin, pixel_width, _, y_origin, _, pixel_height = dataset.GetGeoTransform()
+    x_end = x_origin + dataset.RasterXSize * pixel_width
+    y_end = y_origin + dataset.RasterYSize * pixel_height
+
+    source_srs = osr.SpatialReference(wkt=dataset.GetProjection())
+    target_srs = osr.SpatialReference()
+    target_srs.ImportFromEPSG(4326)
+    for srs in (source_srs, target_srs):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(source_srs, target_srs)
+    # Densify the edges so curved edges in EPSG:4326 stay inside the extent.
+    return transform.TransformBounds(min(x_origin, x_end), min(y_origin, y_end),
+                                     max(x_origin, x_end), max(y_origin, y_end), 21)
+
+def tile_range(extent, zoom):
+    """Return the (x_min, y_min, x_max, y_max) XYZ tile indices that cover a EPSG:4326 extent at a zoom level."""
+    lon_min, lat_min, lon_max, lat_max = extent
+    n = 2 ** zoom
+
+    def tile_x(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def tile_y(lat):
+        # Web Mercator ends at about 85.0511 degrees north and south.
+        lat_rad = math.radians(max(-85.0511287798, min(85.0511287798, lat)))
+        return min(n - 1, max(0, int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)))
+
+    return tile_x(lon_min), tile_y(lat_max), tile_x(lon_max), tile_y(lat_min)
+
+def tile_count(extent, zoom):
+    """Return the number of XYZ tiles that cover a EPSG:4326 extent at a zoom level."""
+    x_min, y_min, x_max, y_max = tile_range(extent, zoom)
+    return (x_max - x_min + 1) * (y_max - y_min + 1)
+
+# QGIS installations whose paths and environment variables are already set up in this process.
+_configured_qgis_paths = set()
+
+def configure_qgis(qgis_main_path):
+    """Set up sys.path and the environment variables for a QGIS installation, once per process."""
+    if qgis_main_path in _configured_qgis_paths:
+        return
     print("Initializing QGIS paths...")
-    configure_qgis_paths(config['qgis_main_path'])
+    configure_qgis_paths(qgis_main_path)
     # Set environment variables for other QGIS and PyQt5 components
     print("Setting environment variables for QT and Python...")    
-    configure_environment_variables(config['qgis_main_path'])
+    configure_environment_variables(qgis_main_path)
     print("Environment settings are DONE...")
-    print("Process started for: ",config["xyz_raster_path"])
-    print("Starting QGIS Application. This may take a minute")
-    # Import necessary libraries from QGIS Python API
-    #from qgis.analysis import QgsNativeAlgorithms
-    from qgis.core import (
-        QgsApplication,
-        QgsProject,    
-        QgsProcessingFeedback, 
-        QgsRasterLayer,
-        QgsCoordinateTransform,
-        QgsCoordinateReferenceSystem
+    _configured_qgis_paths.add(qgis_main_path)
+
+PREVIEW_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+    <title>{title}</title>
+    <meta charset="utf-8"/>
+    <meta http-equiv="X-UA-Compatible" content="IE=edge">
+    <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+    <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+    <style type="text/css">
+        body {{ margin: 0; padding: 0; }}
+        html, body, #map {{ width: 100%; height: 100%; }}
+    </style>
+</head>
+<body>
+    <div id="map"></div>
+    <script>
+        var map = L.map('map', {{ attributionControl: false }}).setView([{center_lat}, {center_lon}], {zoom});
+        L.control.attribution({{ prefix: false }}).addTo(map);
+        {osm}
+        var tilesource_layer = L.tileLayer('{tile_source}', {{
+            minZoom: {zoom_min},
+            maxZoom: {zoom_max},
+            tms: {tms},
+            attribution: '{attribution}'
+        }}).addTo(map);
+    </script>
+</body>
+</html>
+'''
+
+PREVIEW_OSM_LAYER = """var osm_layer = L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
+            maxZoom: 19,
+            attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+        }).addTo(map);"""
+
+def write_preview_html(config, extent):
+    """Write the leaflet preview page of the tiles in config for the whole zoom range.
+
+    Does the same as the OUTPUT_HTML of 'qgis:tilesxyzdirectory', for runs that tile the zoom
+    levels in separate jobs. extent is the (lon_min, lat_min, lon_max, lat_max) extent in EPSG:4326.
+    """
+    output_html = config.get('xyz_output_html', os.path.join(config['xyz_output_path'], 'preview.html'))
+    if not output_html:
+        return
+    lon_min, lat_min, lon_max, lat_max = extent
+    tile_extension = 'png' if config['xyz_tile_format'] == 0 else 'jpg'
+    output_uri = pathlib.Path(config['xyz_output_path']).resolve().as_uri()
+    page = PREVIEW_HTML.format(
+        title=config.get('xyz_html_title') or 'Leaflet Preview',
+        center_lat=(lat_min + lat_max) / 2,
+        center_lon=(lon_min + lon_max) / 2,
+        zoom=round((config['xyz_zoom_min'] + config['xyz_zoom_max']) / 2),
+        osm=PREVIEW_OSM_LAYER if config.get('xyz_html_osm') else '',
+        tile_source=f"{output_uri}/{{z}}/{{x}}/{{y}}.{tile_extension}",
+        zoom_min=config['xyz_zoom_min'],
+        zoom_max=config['xyz_zoom_max'],
+        tms='true' if config.get('xyz_tms_convention') else 'false',
+        attribution=config.get('xyz_html_attribution', ''),
     )
+    with open(output_html, 'w', encoding='utf-8') as html_file:
+        html_file.write(page)
+
+def start_qgis(qgis_main_path, max_threads=None):
+    """Configure the QGIS environment and start a headless QGIS application with the Processing framework loaded.
+
+    max_threads limits the threads QGIS uses for rendering; QGIS picks its own default when omitted.
+    """
+    configure_qgis(qgis_main_path)
+    print("Starting QGIS Application. This may take a minute")
+    from qgis.core import QgsApplication
 
     # Starting the QGIS application
-    qgis_prefix_path = get_qgis_ltr(config['qgis_main_path'], "")
+    qgis_prefix_path = get_qgis_ltr(qgis_main_path, "")
     QgsApplication.setPrefixPath(qgis_prefix_path, True)
 
     qgs = QgsApplication([], False) # QGIS is started without a GUI when set to False. If true, it opens a GUI.
     qgs.initQgis()
+    if max_threads:
+        QgsApplication.setMaxThreads(max_threads)
     
     # Loads the Processing framework.
-    from qgis import processing
     from processing.core.Processing import Processing
     Processing.initialize()
 
     #QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+    return qgs
+
+class XyzTilerSession:
+    """A running QGIS application that tiles any number of rasters.
+
+    QGIS and the Processing framework are started once when the session is entered and
+    exited when it is left, instead of once per xyz_tiler() call:
+
+        with XyzTilerSession(qgis_main_path) as session:
+            for config in configs:
+                session.tile(config)
+    """
+
+    def __init__(self, qgis_main_path, max_threads=None):
+        self.qgis_main_path = qgis_main_path
+        self.max_threads = max_threads
+        self.qgs = None
+
+    def __enter__(self):
+        self.qgs = start_qgis(self.qgis_main_path, self.max_threads)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.qgs is not None:
+            self.qgs.exitQgis()
+            self.qgs = None
+
+    def tile(self, config):
+        """Generate the tiles of one raster with the session's QGIS application."""
+        xyz_tiler(config, self.qgs)
+
+def default_worker_count():
+    """Return how many CPUs this process may actually use.
+
+    os.cpu_count() reports every CPU of the host, even when affinity or a container CPU set limits the
+    process to fewer. Where the affinity is not available (Windows), the physical core count from
+    psutil is used if it is installed, since tile encoding gains little from hyper-threads.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    if psutil is not None:
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    return os.cpu_count() or 1
+
+# QGIS session owned by the current worker process, see init_tiler_worker().
+_worker_session = None
+
+def init_tiler_worker(qgis_main_path, max_threads=None):
+    """Process pool initializer: start QGIS once per worker and stop it when the worker exits."""
+    global _worker_session
+    import multiprocessing.util
+    _worker_session = XyzTilerSession(qgis_main_path, max_threads).__enter__()
+    multiprocessing.util.Finalize(None, _worker_session.close, exitpriority=10)
+
+def tile_zoom_level(config):
+    """Process pool task: generate the tiles of a single zoom level with the worker's QGIS application."""
+    _worker_session.tile(config)
+    return config['xyz_zoom_min']
+
+def tile_raster(config):
+    """Process pool task: generate the tiles of one config with the worker's QGIS application."""
+    _worker_session.tile(config)
+    return config
+
+def xyz_tile_many(configs, max_workers=None):
+    """Generate the tiles of several configs (e.g. several rasters) in parallel worker processes.
+
+    All configs must use the same qgis_main_path. Each worker starts QGIS once and tiles
+    one config after another. QGIS renders with several threads itself, so max_workers
+    defaults to half of the usable CPUs (see default_worker_count()), and those CPUs are
+    split evenly between the workers' render threads.
+    """
+    if not configs:
+        return
+    cpu_count = default_worker_count()
+    max_workers = min(max_workers or max(1, cpu_count // 2), len(configs))
+    threads_per_worker = max(1, cpu_count // max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_tiler_worker,
+                             initargs=(configs[0]['qgis_main_path'], threads_per_worker)) as executor:
+        futures = [executor.submit(tile_raster, config) for config in configs]
+        for future in as_completed(futures):
+            config = future.result()
+            print(f"Tiles of {config['xyz_raster_path']} are generated in {config['xyz_output_path']}.")
+
+def xyz_tiler(config, qgs=None):
+    # A QGIS application that is passed in is left running for the caller's next use.
+    if qgs is None:
+        with XyzTilerSession(config['qgis_main_path']) as session:
+            session.tile(config)
+        return
+    print("Process started for: ",config["xyz_raster_path"])
+    # Import necessary libraries from QGIS Python API
+    #from qgis.analysis import QgsNativeAlgorithms
+    from qgis.core import (
+        QgsProject,    
+        QgsProcessingFeedback, 
+        QgsRasterLayer,
+        QgsCoordinateTransform,
+        QgsCoordinateReferenceSystem
+    )
+    from qgis import processing
 
     # Load the raster layer from provided path and check its validity
     raster_file = config['xyz_raster_path'] # Raster file path.
@@ -178,14 +409,19 @@ def xyz_tiler(config):
         print("Layer failed to load!")
         exit() 
     else:
-        # Converts the current coordinate reference system of the raster layer to the target CRS.
-        source_crs = raster_layer.crs()
         target_crs = QgsCoordinateReferenceSystem.fromEpsgId(4326)
-        transform = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
-        # Converts the current extent of the layer.
-        transformed_extent = transform.transformBoundingBox(raster_layer.extent())
-        # Sets the EXTENT parameter using the converted extent.
-        extent_str = "{},{},{},{}".format(transformed_extent.xMinimum(), transformed_extent.xMaximum(),transformed_extent.yMinimum(),  transformed_extent.yMaximum())
+        if config.get('xyz_extent'):
+            # The extent was already computed once by the caller (see raster_extent_wgs84).
+            lon_min, lat_min, lon_max, lat_max = config['xyz_extent']
+            extent_str = "{},{},{},{}".format(lon_min, lon_max, lat_min, lat_max)
+        else:
+            # Converts the current coordinate reference system of the raster layer to the target CRS.
+            source_crs = raster_layer.crs()
+            transform = QgsCoordinateTransform(source_crs, target_crs, QgsProject.instance())
+            # Converts the current extent of the layer.
+            transformed_extent = transform.transformBoundingBox(raster_layer.extent())
+            # Sets the EXTENT parameter using the converted extent.
+            extent_str = "{},{},{},{}".format(transformed_extent.xMinimum(), transformed_extent.xMaximum(),transformed_extent.yMinimum(),  transformed_extent.yMaximum())
         extent_parameter = extent_str2= extent_str+' '+ '[EPSG:4326]'
 
         # Prepare parameters for the XYZ tile generation    
@@ -206,9 +442,12 @@ def xyz_tiler(config):
             'HTML_TITLE':config['xyz_html_title'],
             'HTML_ATTRIBUTION':config['xyz_html_attribution'],
             'HTML_OSM':config['xyz_html_osm'],
-            'OUTPUT_DIRECTORY': config['xyz_output_path'],
-            'OUTPUT_HTML': config['xyz_output_path']+'/preview.html'
+            'OUTPUT_DIRECTORY': config['xyz_output_path']
         }
+        # The leaflet preview is optional; an empty xyz_output_html skips it.
+        output_html = config.get('xyz_output_html', config['xyz_output_path']+'/preview.html')
+        if output_html:
+            params['OUTPUT_HTML'] = output_html
 
         QgsProject.instance().setCrs(target_crs)
         QgsProject.instance().addMapLayer(raster_layer, True)
@@ -219,8 +458,7 @@ def xyz_tiler(config):
         processing.run("qgis:tilesxyzdirectory", params, feedback=feedback)
 
         print("XYZ Tile generation process completed. All layers have been successfully created :)")
-    # Terminates the QGIS application.
-    qgs.exitQgis()
+        QgsProject.instance().removeMapLayer(raster_layer)
 
 if __name__ == "__main__":
     # Example configuration for testing